@@ -1,4 +1,5 @@
 import os
+import threading
 import uuid
 from pathlib import Path
 
@@ -9,28 +10,34 @@ from dotenv import load_dotenv
 try:
     from src.core.logger_config import setup_logger
     from src.core.agent import RAGAgent
-    from src.core.chat_runtime import ChatRuntime
+    from src.core.chat_runtime import ChatRuntime, open_checkpointer
 except Exception:  # fallback if running from repo root
     from logger_config import setup_logger  # type: ignore
     from agent import RAGAgent  # type: ignore
-    from chat_runtime import ChatRuntime  # type: ignore
+    from chat_runtime import ChatRuntime, open_checkpointer  # type: ignore
 
 load_dotenv()
 logger = setup_logger()
 
 # ---- Configuration ----
 KB_PATH = os.getenv("KB_PATH", "policies_db.json")
+DB_PATH = os.getenv("DB_PATH", "chat_state.db")
 
 # Singletons to avoid reinitialization across requests
 _runtime: ChatRuntime | None = None
+_runtime_lock = threading.Lock()
 
 
 def _ensure_runtime() -> ChatRuntime:
     global _runtime
     if _runtime is None:
-        logger.info("Booting RAGAgent + ChatRuntime with KB=%s", KB_PATH)
-        agent = RAGAgent(knowledge_base=KB_PATH)
-        _runtime = ChatRuntime(agent)  # your SQLite-backed persistence
+        # Double-checked so concurrent first requests build only one agent
+        with _runtime_lock:
+            if _runtime is None:
+                logger.info("Booting RAGAgent + ChatRuntime with KB=%s", KB_PATH)
+                # Checkpointer first, so the graph is compiled once with persistence
+                agent = RAGAgent(knowledge_base=KB_PATH, checkpointer=open_checkpointer(DB_PATH))
+                _runtime = ChatRuntime(agent, db_file=DB_PATH)  # your SQLite-backed persistence
     return _runtime
 
 
@@ -43,21 +50,24 @@ def _new_thread_id(session_hash: str | None) -> str:
 
 
 # ---- Chat function (gr.ChatInterface contract) ----
-# Accepts (message, history, thread_id) where thread_id comes from gr.State
+# Accepts (message, history, thread_id) where thread_id comes from gr.State;
+# yields the growing reply so Gradio renders tokens as they arrive
 
-def chat(message: str, history: list[dict], thread_id: str | None) -> str:
+async def chat(message: str, history: list[dict], thread_id: str | None):
     try:
         runtime = _ensure_runtime()
         if not thread_id:
             # Fallback: generate a temporary thread if state was empty
             thread_id = _new_thread_id(None)
         logger.info("[thread=%s] User: %s", thread_id, message)
-        reply = runtime.chat(message, thread_id)
+        reply = ""
+        async for token in runtime.stream_chat(message, thread_id):
+            reply += token
+            yield reply
         logger.info("[thread=%s] Assistant: %s", thread_id, reply)
-        return reply
     except Exception as e:
         logger.exception("Chat error")
-        return f"Sorry — something went wrong on my side: {type(e).__name__}: {e}"
+        yield f"Sorry — something went wrong on my side: {type(e).__name__}: {e}"
 
 
 # ---- Gradio UI ----
@@ -133,5 +143,7 @@ def build_ui() -> gr.Blocks:
 
 
 if __name__ == "__main__":
+    # Pay the FAISS load + model init before the first request, not inside it
+    _ensure_runtime().agent.warmup()
     ui = build_ui()
-    ui.launch()
\ No newline at end of file
+    ui.queue(max_size=32).launch()
\ No newline at end of file
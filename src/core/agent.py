@@ -1,4 +1,4 @@
-import os, json, pickle, hashlib
+import os, json, hashlib, mmap, tempfile
 from pathlib import Path
 from typing import List
 from dotenv import load_dotenv
@@ -6,41 +6,171 @@ from datetime import datetime
 import pytz
 import logging
 import time
+import asyncio
+import itertools
+import threading
+import numpy as np
+import orjson
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import xxhash
+except ImportError:  # optional: BLAKE2b fallback below
+    xxhash = None
 
 from src.core.prompts import SYSTEM_PROMPT, TOOLS_POLICY
 from src.core.logger_config import setup_logger
+from src.core.cache import SemanticCache, unit_vector
+from src.core.embeddings import CachedEmbeddings
+from src.core.docstore import ColumnarDocstore
+from src.core.vector_index import (
+    build_hnsw_index, build_ivfpq_index, build_sq8_index, apply_search_params, read_index, to_gpu,
+    HNSW_EF_SEARCH, PQ_NPROBE, PQ_MIN_TRAIN
+)
 
 from langchain.chat_models import init_chat_model
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import JSONLoader
-from langchain_core.tools import Tool
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, Field, ValidationError
 from langgraph.prebuilt import ToolNode, tools_condition
-from langchain_core.messages import SystemMessage, HumanMessage, message_to_dict
+from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage, message_to_dict
 from langgraph.graph import START, END, StateGraph, MessagesState
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+import faiss
 
 
 load_dotenv()
 
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+MERGE_MAX_CHARS = 1150
+MIN_CHUNK_CHARS = 100
+MIN_OVERLAP_MATCH = 20
+CACHE_VERSION = "v4resplit"
 CACHE_DIR = Path("./rag_cache")
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
+EMBED_MODEL = "text-embedding-3-small"
+EMBED_DIMENSIONS = 512  # server-side Matryoshka truncation
+CHAT_MODEL = "gpt-5-mini"
+REASONING_EFFORT = "minimal"
+ROUTER_NODE = "query_or_respond"  # may answer directly or call retrieve
+ANSWER_NODE = "generate"
+CHECKPOINT_DURABILITY = "async"  # persist checkpoints in the background while the next step runs
 RETRIEVE_K = 5
+HASH_SLICE = 16 << 20
+HTTP_MAX_KEEPALIVE = 20
+HTTP_MAX_CONNECTIONS = 40
+EMBED_BATCH_SIZE = 512
+EMBED_CONCURRENCY = 8  # in-flight embedding requests during index builds
+QUERY_CACHE_SIZE = 512
+QUERY_CACHE_THRESHOLD = 0.97
+RRF_K = 60
+
+def _run_sync(coro):
+    """asyncio.run, or on a helper thread when this thread already runs an event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+class RetrieveInput(BaseModel):
+    queries: List[str] = Field(description="2-4 short, neutral search queries, one per facet")
 
 def _file_hash(path: str) -> str:
     """Stable key so cache is invalidated if source changes."""
-    h = hashlib.sha256()
+    # Only a cache key, so a fast non-cryptographic hash is enough when available
+    h = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
     with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            h.update(chunk)
-    h.update(f"::cs={CHUNK_SIZE}::co={CHUNK_OVERLAP}".encode())
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as mv:
+                for i in range(0, len(mv), HASH_SLICE):
+                    h.update(mv[i:i + HASH_SLICE])
+    h.update(f"::cs={CHUNK_SIZE}::co={CHUNK_OVERLAP}::em={EMBED_MODEL}:{EMBED_DIMENSIONS}::{CACHE_VERSION}".encode())
     return h.hexdigest()[:16]
 
+def _meta_path(path: str) -> Path:
+    return CACHE_DIR / f"meta_{hashlib.blake2b(path.encode(), digest_size=8).hexdigest()}.json"
+
+def _cache_key(path: str) -> tuple[str, dict | None]:
+    """
+    `_file_hash`, skipped on warm starts: the last key is kept in a small meta file
+    and reused while the KB's size/mtime and every cache-affecting setting match.
+    Returns the key and, when it had to be hashed, the meta record to hand to
+    `_save_cache_meta` once the caches it vouches for are on disk (else None).
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    fingerprint = {
+        "path": path, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+        "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+        "embed_model": EMBED_MODEL, "embed_dimensions": EMBED_DIMENSIONS,
+        "hasher": "xxh3_128" if xxhash is not None else "blake2b", "version": CACHE_VERSION,
+    }
+    try:
+        meta = orjson.loads(_meta_path(path).read_bytes())
+        if meta["fingerprint"] == fingerprint:
+            return meta["cache_key"], None
+    except (OSError, orjson.JSONDecodeError, KeyError, TypeError):
+        pass
+    key = _file_hash(path)
+    return key, {"fingerprint": fingerprint, "cache_key": key}
+
+def _save_cache_meta(meta: dict) -> None:
+    """Atomically write the warm-start sentinel produced by `_cache_key`."""
+    meta_path = _meta_path(meta["fingerprint"]["path"])
+    fd, tmp = tempfile.mkstemp(dir=meta_path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(meta))
+        os.replace(tmp, meta_path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+def _join_overlapping(a: str, b: str) -> str:
+    """Concatenate adjacent splits, dropping the overlap the splitter repeated at the start of `b`."""
+    for k in range(min(len(a), len(b), CHUNK_OVERLAP), MIN_OVERLAP_MATCH - 1, -1):
+        if a.endswith(b[:k]):
+            return a + b[k:]
+    return a + "\n" + b
+
+def _merge_small_chunks(splits: List[Document]) -> List[Document]:
+    """
+    Greedily merge adjacent splits of the same record while they fit in MERGE_MAX_CHARS;
+    splits shorter than MIN_CHUNK_CHARS are folded into their neighbour regardless.
+    """
+    merged: List[Document] = []
+    for doc in splits:
+        prev = merged[-1] if merged else None
+        if prev is not None and prev.metadata == doc.metadata:
+            joined = _join_overlapping(prev.page_content, doc.page_content)
+            if (len(joined) <= MERGE_MAX_CHARS
+                    or len(prev.page_content) < MIN_CHUNK_CHARS
+                    or len(doc.page_content) < MIN_CHUNK_CHARS):
+                merged[-1] = Document(page_content=joined, metadata=prev.metadata)
+                continue
+        merged.append(doc)
+    return merged
+
+def _resplit_oversized(chunks: List[Document], splitter: RecursiveCharacterTextSplitter) -> List[Document]:
+    """Re-split anything over MERGE_MAX_CHARS with the same separator cascade."""
+    out: List[Document] = []
+    for doc in chunks:
+        if len(doc.page_content) > MERGE_MAX_CHARS:
+            out.extend(splitter.split_documents([doc]))
+        else:
+            out.append(doc)
+    return out
+
 class RAGAgent:
-    def __init__(self, knowledge_base: str, checkpointer = None):
+    def __init__(self, knowledge_base: str, checkpointer = None, use_pq: bool = False,
+                 build_graph_now: bool = True, ef_search: int = HNSW_EF_SEARCH, nprobe: int = PQ_NPROBE,
+                 use_gpu: bool = False, use_sq8: bool = False):
         self.logger = logging.getLogger("app.agent")
         self.logger.info("********************* Setting up RAG Agent... *********************")
 
@@ -50,124 +180,299 @@ class RAGAgent:
                 raise FileNotFoundError(f"KB not found: {knowledge_base}")
 
             self.knowledge_base = knowledge_base
-            self.cache_key = _file_hash(knowledge_base)
+            if use_pq and use_sq8:
+                raise ValueError("use_pq and use_sq8 are mutually exclusive")
+            if use_gpu and not use_pq:
+                raise ValueError("use_gpu requires use_pq: HNSW and SQ8 indexes have no GPU implementation")
+            self.use_pq = use_pq
+            self.use_sq8 = use_sq8
+            self.ef_search = ef_search
+            self.nprobe = nprobe
+            self.use_gpu = use_gpu
+            self.cache_key, cache_meta = _cache_key(knowledge_base)
             self.logger.debug("Computed cache key: %s", self.cache_key)
 
             t0 = time.perf_counter()
-            self.embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-            self.llm = init_chat_model("gpt-5-mini", model_provider="openai")
-            self.loader = JSONLoader(file_path=knowledge_base, jq_schema=".[]", text_content=False)
+            # One keep-alive pool shared by the embedding and chat clients; index builds
+            # embed through the async client, whose EMBED_CONCURRENCY requests fit the same limits
+            limits = httpx.Limits(max_keepalive_connections=HTTP_MAX_KEEPALIVE, max_connections=HTTP_MAX_CONNECTIONS)
+            self.http_client = httpx.Client(limits=limits)
+            self.embeddings = CachedEmbeddings(
+                # chunk_size matches our batches, so each embed_documents call is one HTTP request
+                OpenAIEmbeddings(model=EMBED_MODEL, dimensions=EMBED_DIMENSIONS, chunk_size=EMBED_BATCH_SIZE,
+                                 http_client=self.http_client, http_async_client=httpx.AsyncClient(limits=limits)),
+                cache_dir=CACHE_DIR / "emb" / f"{EMBED_MODEL}-{EMBED_DIMENSIONS}"
+            )
+            self.llm = init_chat_model(CHAT_MODEL, model_provider="openai", reasoning_effort=REASONING_EFFORT,
+                                       http_client=self.http_client)
             self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
             self.logger.info("Models and loaders initialized in %.2f ms", (time.perf_counter() - t0) * 1000)
 
-            self._chunks_pkl = CACHE_DIR / f"{self.cache_key}.pkl"
-            self._faiss_dir = CACHE_DIR / f"faiss_{self.cache_key}"
+            self._chunks_path = CACHE_DIR / f"{self.cache_key}.arrow"
+            index_kind = "ivfpq" if use_pq else "sq8" if use_sq8 else "hnsw"
+            self._faiss_dir = CACHE_DIR / f"faiss_{self.cache_key}_{index_kind}_ip"
 
-            self.chunks = self._load_or_build_chunks()
             self.vector_store = self._load_or_build_vector_store()
+            if cache_meta is not None:
+                # Only vouch for the caches once the docstore and index are safely on disk
+                _save_cache_meta(cache_meta)
+            self.docstore = self.vector_store.docstore
+            self._query_cache = SemanticCache(maxsize=QUERY_CACHE_SIZE, threshold=QUERY_CACHE_THRESHOLD)
 
             # Expose bound method as a tool (no self in schema)
-            self.retrieve_tool = Tool.from_function(
-                func=self.retrieve,
+            self.retrieve_tool = StructuredTool.from_function(
+                func=self.retrieve_many,
                 name="retrieve",
-                description="Retrieve info related to a query"
+                description="Retrieve info related to one or more queries",
+                args_schema=RetrieveInput
             )
+            self.llm_with_tools = self.llm.bind_tools([self.retrieve_tool])
+            self._tools_system = SystemMessage(TOOLS_POLICY)
+            self._system_prefix = SYSTEM_PROMPT + "\nContext:\n"
             self.checkpointer = checkpointer
-
-            try:
-                self.logger.info("Building Graph...")
-                t1 = time.perf_counter()
-                self._build_graph()
-                self.logger.info("Graph build successful in %.2f ms", (time.perf_counter() - t1) * 1000)
-            except Exception:
-                self.logger.exception("Graph build failed")
-                raise
-
+            self.graph = None
+
+            # Callers that attach a checkpointer later skip this compile and build once themselves
+            if build_graph_now:
+                try:
+                    self.logger.info("Building Graph...")
+                    t1 = time.perf_counter()
+                    self._build_graph()
+                    self.logger.info("Graph build successful in %.2f ms", (time.perf_counter() - t1) * 1000)
+                except Exception:
+                    self.logger.exception("Graph build failed")
+                    raise
+
+            self._warm_thread = threading.Thread(target=self._warm_connections, name="rag-warmup", daemon=True)
+            self._warm_thread.start()
             self.logger.info("Initialization successful!")
         except Exception:
             self.logger.exception("Initialization failed")
             raise
 
-    def _load_or_build_chunks(self) -> List[Document]:
+    def _load_docs(self) -> List[Document]:
+        """
+        One Document per top-level KB record, serialized back to compact JSON.
+        Like the old jq `.[]` schema, a top-level object yields one record per value.
+        """
+        data = orjson.loads(Path(self.knowledge_base).read_bytes())
+        records = data.values() if isinstance(data, dict) else data
+        return [
+            Document(page_content=orjson.dumps(r).decode(), metadata={"source": self.knowledge_base, "idx": i})
+            for i, r in enumerate(records)
+        ]
+
+    def _load_or_build_chunks(self) -> ColumnarDocstore:
         try:
-            if self._chunks_pkl.exists():
+            if self._chunks_path.exists():
                 t0 = time.perf_counter()
-                with open(self._chunks_pkl, "rb") as f:
-                    chunks = pickle.load(f)
+                chunks = ColumnarDocstore.load(self._chunks_path)
                 self.logger.info("Loaded %d chunks from cache: %s (%.2f ms)",
-                                 len(chunks), self._chunks_pkl, (time.perf_counter() - t0) * 1000)
+                                 len(chunks), self._chunks_path, (time.perf_counter() - t0) * 1000)
                 return chunks
 
             self.logger.info("Cache miss. Loading and splitting documents from %s", self.knowledge_base)
             t1 = time.perf_counter()
-            docs = self.loader.load()
+            docs = self._load_docs()
             if not docs:
                 self.logger.warning("No documents loaded from %s", self.knowledge_base)
-            splits = self.text_splitter.split_documents(docs)
-            with open(self._chunks_pkl, "wb") as f:
-                pickle.dump(splits, f)
+            raw_splits = self.text_splitter.split_documents(docs)
+            splits = _resplit_oversized(_merge_small_chunks(raw_splits), self.text_splitter)
+            self.logger.info("Merged %d splits into %d chunks", len(raw_splits), len(splits))
+            chunks = ColumnarDocstore.from_documents(splits)
+            chunks.save(self._chunks_path)
             self.logger.info("Created and cached %d chunks at %s (%.2f ms)",
-                             len(splits), self._chunks_pkl, (time.perf_counter() - t1) * 1000)
-            return splits
+                             len(chunks), self._chunks_path, (time.perf_counter() - t1) * 1000)
+            return chunks
         except Exception:
             self.logger.exception("Failed to load or build chunks")
             raise
 
-    def _load_or_build_vector_store(self):
+    def _wrap_index(self, index, docstore: ColumnarDocstore) -> FAISS:
+        if self.use_gpu and not isinstance(index, faiss.IndexIVFPQ):
+            # Too few chunks to train PQ, so the build fell back to HNSW
+            self.logger.warning("GPU offload needs an IVF-PQ index, got %s; searching on CPU",
+                                type(index).__name__)
+        elif self.use_gpu:
+            try:
+                index = to_gpu(index)
+                self.logger.info("Moved FAISS index to GPU (%s)", type(index).__name__)
+            except RuntimeError:
+                self.logger.warning("GPU offload unavailable; searching on CPU", exc_info=True)
+        # FAISS row i is docstore row i, so the id map is the identity
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=range(len(docstore)),
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+        )
+
+    def _load_or_build_vector_store(self) -> FAISS:
+        index_path = self._faiss_dir / "index.faiss"
         try:
-            if self._faiss_dir.exists():
+            # The chunk cache doubles as the docstore: FAISS row i is chunk i
+            chunks = self._load_or_build_chunks()
+            if index_path.exists():
                 t0 = time.perf_counter()
-                vs = FAISS.load_local(
-                    folder_path=str(self._faiss_dir),
-                    embeddings=self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
+                index = read_index(index_path)
+                apply_search_params(index, ef_search=self.ef_search, nprobe=self.nprobe)
                 self.logger.info("Loaded FAISS index from %s (%.2f ms)",
                                  self._faiss_dir, (time.perf_counter() - t0) * 1000)
-                return vs
+                return self._wrap_index(index, chunks)
 
-            self.logger.info("Building FAISS index (chunks=%d)", len(self.chunks))
+            self.logger.info("Building FAISS index (chunks=%d)", len(chunks))
             t1 = time.perf_counter()
-            vs = FAISS.from_documents(self.chunks, self.embeddings)
-            vs.save_local(str(self._faiss_dir))
+            vectors = np.asarray(self._embed_texts(chunks.texts()), dtype=np.float32)
+            if self.use_pq and len(vectors) < PQ_MIN_TRAIN:
+                self.logger.warning("Only %d chunks; too few to train PQ, falling back to HNSW", len(vectors))
+                index = build_hnsw_index(vectors)
+            elif self.use_pq:
+                index = build_ivfpq_index(vectors)
+            elif self.use_sq8:
+                index = build_sq8_index(vectors)
+            else:
+                index = build_hnsw_index(vectors)
+
+            self._faiss_dir.mkdir(parents=True, exist_ok=True)
+            # Same write-then-rename as the docstore, so a crash never leaves a truncated index
+            tmp_path = index_path.with_suffix(".faiss.tmp")
+            faiss.write_index(index, str(tmp_path))
+            os.replace(tmp_path, index_path)
+            apply_search_params(index, ef_search=self.ef_search, nprobe=self.nprobe)
             self.logger.info("Built and saved FAISS index to %s (%.2f ms)",
                              self._faiss_dir, (time.perf_counter() - t1) * 1000)
-            return vs
+            return self._wrap_index(index, chunks)
         except Exception:
             self.logger.exception("Failed to load or build vector store")
             raise
 
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts in fixed-size batches, with up to EMBED_CONCURRENCY requests in flight.
+        """
+        batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+        if not batches:
+            return []
+        t0 = time.perf_counter()
+        results = _run_sync(self._aembed_batches(batches))
+        vectors = [v for batch in results for v in batch]
+        self.logger.info("Embedded %d texts in %d batches (%.2f ms)",
+                         len(vectors), len(batches), (time.perf_counter() - t0) * 1000)
+        return vectors
+
+    async def _aembed_batches(self, batches: List[List[str]]) -> List[List[List[float]]]:
+        semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+        async def _embed(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self.embeddings.aembed_documents(batch)
+
+        # gather returns results in submission order, so vectors stay aligned with texts
+        return await asyncio.gather(*(_embed(b) for b in batches))
+
+    def _search(self, queries: List[str]) -> List[List[int]]:
+        """
+        Top-k chunk row ids per query. Cache misses are embedded in a single request
+        and searched with a single batched index call.
+        """
+        keys = [SemanticCache.normalize(q) for q in queries]
+        results = [self._query_cache.get_exact(key) for key in keys]
+        misses = [i for i, ids in enumerate(results) if ids is None]
+        if not misses:
+            return results
+
+        pending = []
+        for i, vector in zip(misses, self.embeddings.embed_queries([queries[i] for i in misses])):
+            vector = unit_vector(vector)
+            ids = self._query_cache.get_similar(vector)
+            if ids is None:
+                pending.append((i, vector))
+            else:
+                results[i] = ids
+
+        if pending:
+            # One (B, d) x (N, d)^T search instead of B single-row searches
+            _, found = self.vector_store.index.search(np.stack([v for _, v in pending]), RETRIEVE_K)
+            for (i, vector), row in zip(pending, found):
+                ids = [int(j) for j in row if j != -1]
+                self._query_cache.put(keys[i], vector, ids)
+                results[i] = ids
+        return results
+
+    @staticmethod
+    def _serialize(docs: List[Document]) -> str:
+        # str.join materializes generators into a list anyway, so hand it one directly
+        return "\n\n".join([
+            f"Source: {doc.metadata}\nContent: {doc.page_content}"
+            for doc in docs
+        ])
+
     def retrieve(self, query: str) -> str:
         """
         Retrieve information related to a query.
         """
-        self.logger.info("Retrieve called with k=%d | query=%r", RETRIEVE_K, query)
+        return self.retrieve_many([query])
+
+    def retrieve_many(self, queries: List[str]) -> str:
+        """
+        Retrieve information related to several queries. Hits are deduplicated by
+        chunk and ordered by reciprocal rank fusion across the queries.
+        """
+        self.logger.info("Retrieve called with k=%d | queries=%r", RETRIEVE_K, queries)
         try:
             t0 = time.perf_counter()
-            retrieved_docs = self.vector_store.similarity_search(query, k=RETRIEVE_K)
+            scores: dict = {}
+            for ids in self._search(queries):
+                for rank, j in enumerate(ids):
+                    scores[j] = scores.get(j, 0.0) + 1.0 / (RRF_K + rank + 1)
+            retrieved_docs = [self.docstore.search(j) for j in sorted(scores, key=scores.get, reverse=True)]
             dt = (time.perf_counter() - t0) * 1000
-            self.logger.info("Retrieved %d docs in %.2f ms", len(retrieved_docs), dt)
+            self.logger.info("Retrieved %d docs for %d queries in %.2f ms", len(retrieved_docs), len(queries), dt)
 
-            serialized = "\n\n".join(
-                (f"Source: {doc.metadata}\nContent: {doc.page_content}")
-                for doc in retrieved_docs
-            )
+            serialized = self._serialize(retrieved_docs)
             if not serialized:
-                self.logger.warning("Retrieve returned empty serialization for query=%r", query)
+                self.logger.warning("Retrieve returned empty serialization for queries=%r", queries)
             return serialized
         except Exception:
-            self.logger.exception("Retrieve failed for query=%r", query)
+            self.logger.exception("Retrieve failed for queries=%r", queries)
             raise
 
+    def warmup(self) -> None:
+        """
+        Run one throwaway search so the index pages and HTTP connection are hot.
+        Waits for the background connection warmup, whose "warmup" query vector
+        the search then reuses instead of embedding it a second time.
+        """
+        self._warm_thread.join()
+        try:
+            t0 = time.perf_counter()
+            self.vector_store.similarity_search("warmup", k=1)
+            self.logger.info("Warmup search completed in %.2f ms", (time.perf_counter() - t0) * 1000)
+        except Exception:
+            self.logger.warning("Warmup search failed", exc_info=True)
+
+    def _warm_connections(self) -> None:
+        """
+        Open the OpenAI HTTP connection (DNS + TLS) off the request path. Embeddings
+        and chat share one host and one pool, so a single embedding request warms both.
+        """
+        try:
+            t0 = time.perf_counter()
+            self.embeddings.embed_query("warmup")
+            self.logger.info("HTTP connections warmed in %.2f ms", (time.perf_counter() - t0) * 1000)
+        except Exception:
+            self.logger.warning("Connection warmup failed", exc_info=True)
+
     def query_or_respond(self, state: MessagesState):
         """
         Either query the knowledge base or respond directly
         """
         try:
-            self.logger.debug("query_or_respond: messages=%d", len(state["messages"]))
-            llm_with_tools = self.llm.bind_tools([self.retrieve_tool])
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("query_or_respond: messages=%d", len(state["messages"]))
             t0 = time.perf_counter()
-            response = llm_with_tools.invoke([SystemMessage(TOOLS_POLICY)] + state["messages"])
+            response = self.llm_with_tools.invoke([self._tools_system] + state["messages"])
             self.logger.info("LLM invoke (query_or_respond) completed in %.2f ms",
                              (time.perf_counter() - t0) * 1000)
             return {"messages": [response]}
@@ -180,18 +485,10 @@ class RAGAgent:
         Generate a final answer
         """
         try:
-            recent_tool_messages = []
-            for message in reversed(state["messages"]):
-                if message.type == "tool":
-                    recent_tool_messages.append(message)
-                else:
-                    break
-            tool_messages = recent_tool_messages[::-1]
+            tool_messages = list(itertools.takewhile(lambda m: m.type == "tool", reversed(state["messages"])))[::-1]
             self.logger.debug("generate: found %d recent tool messages", len(tool_messages))
 
-            docs_content = "\n\n".join(doc.content for doc in tool_messages)
-            if not docs_content:
-                self.logger.warning("generate: no tool content found; proceeding with conversation only")
+            system_message = self._context_message(tool_messages)
 
             conversation_messages = [
                 message
@@ -201,7 +498,7 @@ class RAGAgent:
             ]
             self.logger.debug("generate: conversation messages=%d", len(conversation_messages))
 
-            prompt = [SystemMessage(SYSTEM_PROMPT + f"\nContext:\n{docs_content}")] + conversation_messages
+            prompt = [system_message] + conversation_messages
 
             t0 = time.perf_counter()
             response = self.llm.invoke(prompt)
@@ -211,6 +508,11 @@ class RAGAgent:
             self.logger.exception("generate failed")
             raise
 
+    def _context_message(self, tool_messages) -> SystemMessage:
+        if not any(m.content for m in tool_messages):
+            self.logger.warning("generate: no tool content found; proceeding with conversation only")
+        return SystemMessage(self._system_prefix + "\n\n".join(m.content for m in tool_messages))
+
     def _build_graph(self):
         try:
             graph_builder = StateGraph(MessagesState)
@@ -272,17 +574,61 @@ class RAGAgent:
     #         raise
 
     def invoke(self, question: str) -> str:
-        result = self.graph.invoke({
-            "messages": [HumanMessage(content=question)]
-        })
-        msgs = result["messages"]
-        final_ai = next((m for m in reversed(msgs) if m.type == "ai" and not getattr(m, "tool_calls", None)), msgs[-1])
-        return final_ai.content if hasattr(final_ai, "content") else str(final_ai)
+        """
+        One-shot answer without persistence. Runs the graph's steps directly
+        (query_or_respond -> tools -> generate) instead of going through Pregel.
+        """
+        messages = [HumanMessage(content=question)]
+        ai = self.query_or_respond({"messages": messages})["messages"][0]
+        if not getattr(ai, "tool_calls", None):
+            return ai.content
+        messages.append(ai)
+        for call in ai.tool_calls:
+            # Same contract as ToolNode: unknown tools and bad arguments go back to the
+            # model as error messages; anything else (e.g. the embeddings API being down) raises
+            if call["name"] != self.retrieve_tool.name:
+                self.logger.warning("Model called unknown tool %r", call["name"])
+                content, status = f"Error: {call['name']} is not a valid tool, try one of [{self.retrieve_tool.name}].", "error"
+            else:
+                try:
+                    content, status = self.retrieve_tool.invoke(call["args"]), "success"
+                except ValidationError as e:
+                    self.logger.warning("Tool call %s had invalid arguments; returning the error to the model", call["name"])
+                    content, status = f"Error: {e!r}\n Please fix your mistakes.", "error"
+            messages.append(ToolMessage(content=content, tool_call_id=call["id"], name=call["name"], status=status))
+        return self.generate({"messages": messages})["messages"][0].content
+
+    def stream(self, question: str, config: dict | None = None):
+        """
+        Yield answer tokens as the LLM produces them. Router tokens stream until the
+        router starts a tool call; anything it writes after that is dropped.
+        """
+        if self.graph is None:
+            self._build_graph()
+        # durability only means something (and only avoids a warning) with a checkpointer
+        extra = {"durability": CHECKPOINT_DURABILITY} if self.checkpointer is not None else {}
+        tool_call = False
+        for chunk, meta in self.graph.stream(
+            {"messages": [HumanMessage(content=question)]},
+            config=config,
+            stream_mode="messages",
+            **extra,
+        ):
+            node = meta.get("langgraph_node")
+            if node == ROUTER_NODE:
+                tool_call = tool_call or bool(getattr(chunk, "tool_call_chunks", None) or getattr(chunk, "tool_calls", None))
+                if tool_call:
+                    continue
+            elif node != ANSWER_NODE:
+                continue
+            if isinstance(chunk.content, str) and chunk.content:
+                yield chunk.content
 
 if __name__ == "__main__":
     setup_logger()
 
     agent = RAGAgent(knowledge_base="policies_db.json")
     question = "Hello. What can you do?"
-    answer = agent.invoke(question)
-    print(answer)
\ No newline at end of file
+    for token in agent.stream(question):
+        print(token, end="", flush=True)
+    print()
\ No newline at end of file
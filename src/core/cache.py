@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+
+def unit_vector(vector) -> np.ndarray:
+    """Return `vector` as a contiguous float32 array scaled to unit L2 norm."""
+    v = np.ascontiguousarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm > 0 else v
+
+
+class SemanticCache:
+    """
+    LRU cache of retrieval results.
+
+    Lookups hit on the normalized query text first, then on cosine similarity
+    of the (unit) query embedding against every cached embedding at once.
+    """
+
+    def __init__(self, maxsize: int = 512, threshold: float = 0.97):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._slots: "OrderedDict[str, int]" = OrderedDict()  # key -> row in _matrix, LRU order
+        self._keys: list = []                                  # row -> key
+        self._results: dict = {}
+        self._matrix: Optional[np.ndarray] = None
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def get_exact(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key not in self._slots:
+                return None
+            self._slots.move_to_end(key)
+            return self._results[key]
+
+    def get_similar(self, vector: np.ndarray) -> Optional[Any]:
+        with self._lock:
+            n = len(self._keys)
+            if not n:
+                return None
+            scores = np.dot(self._matrix[:n], vector)
+            row = int(np.argmax(scores))
+            if scores[row] < self.threshold:
+                return None
+            key = self._keys[row]
+            self._slots.move_to_end(key)
+            return self._results[key]
+
+    def put(self, key: str, vector: np.ndarray, result: Any) -> None:
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.empty((self.maxsize, vector.shape[0]), dtype=np.float32)
+
+            if key in self._slots:
+                row = self._slots[key]
+                self._slots.move_to_end(key)
+            elif len(self._keys) < self.maxsize:
+                row = len(self._keys)
+                self._keys.append(key)
+                self._slots[key] = row
+            else:
+                old_key, row = self._slots.popitem(last=False)
+                del self._results[old_key]
+                self._keys[row] = key
+                self._slots[key] = row
+
+            self._matrix[row] = vector
+            self._results[key] = result
@@ -1,40 +1,127 @@
-import json, logging
+import logging
+import orjson
+import asyncio
 from pathlib import Path
 from datetime import datetime
 import pytz
 import sqlite3
 import time
+import queue
+from contextlib import contextmanager
 
 from langchain_core.messages import HumanMessage, message_to_dict
 from langgraph.checkpoint.sqlite import SqliteSaver
-from src.core.agent import RAGAgent
+from src.core.agent import RAGAgent, CHECKPOINT_DURABILITY
+
+_STREAM_DONE = object()
+
+READ_POOL_SIZE = 4
+# SqliteSaver.setup() already switches the file to WAL; these tune each connection
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
+def _connect(db_file: str, read_only: bool = False) -> sqlite3.Connection:
+    if read_only:
+        conn = sqlite3.connect(f"{Path(db_file).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(db_file, check_same_thread=False)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def open_checkpointer(db_file: str) -> SqliteSaver:
+    """Writer checkpointer for the graph; create it before the agent so the graph compiles once."""
+    return SqliteSaver(_connect(db_file))
+
+def _sqlite_path(checkpointer) -> str | None:
+    """File behind a SqliteSaver's connection; None for other savers and in-memory databases."""
+    if not isinstance(checkpointer, SqliteSaver):
+        return None
+    for _, name, path in checkpointer.conn.execute("PRAGMA database_list"):
+        if name == "main":
+            return path or None
+    return None
 
 class ChatRuntime:
     def __init__(self, agent: RAGAgent, db_file="chat_state.db", logger_name="app.chat"):
         self.logger = logging.getLogger(logger_name)
         if agent.checkpointer is None:
-            conn = sqlite3.connect(db_file, check_same_thread=False)
-            agent.checkpointer = SqliteSaver(conn)
+            agent.checkpointer = open_checkpointer(db_file)
+            agent._build_graph()
+        elif agent.graph is None:
             agent._build_graph()
         self.agent = agent
-        self.logger.info("ChatRuntime initialized with DB file: %s", db_file)
 
-    def chat(self, text: str, thread_id: str) -> str:
+        # Readers open the database behind the graph's own checkpointer, which may not be db_file
+        self._readers: queue.Queue | None = None
+        db_path = _sqlite_path(agent.checkpointer)
+        if db_path:
+            # The writer creates the tables and WAL mode up front, so read-only
+            # readers can open the file and their own setup() finds nothing to write
+            agent.checkpointer.setup()
+            self._readers = queue.Queue()
+            for _ in range(READ_POOL_SIZE):
+                self._readers.put(SqliteSaver(_connect(db_path, read_only=True)))
+        else:
+            self.logger.info("Checkpointer is not file-backed SQLite; reading history through the graph")
+        self.logger.info("ChatRuntime initialized with DB file: %s", db_path or db_file)
+
+    async def chat(self, text: str, thread_id: str) -> str:
         cfg = {"configurable": {"thread_id": thread_id}}
-        self.logger.info(f"Turn | thread={thread_id} | text={text}")
-        result = self.agent.graph.invoke({
+        self.logger.info("Turn | thread=%s | text=%s", thread_id, text)
+        # SqliteSaver is sync-only (its a* methods raise), so run the graph off the event loop
+        result = await asyncio.to_thread(self.agent.graph.invoke, {
             "messages": [HumanMessage(content=text)],
-        }, config=cfg)
+        }, config=cfg, durability=CHECKPOINT_DURABILITY)
         msgs = result["messages"]
         final_ai = next(
             (m for m in reversed(msgs) if m.type == "ai" and not getattr(m, "tool_calls", None)), msgs[-1]
             )
         return final_ai.content if hasattr(final_ai, "content") else str(final_ai)
-    
+
+    async def stream_chat(self, text: str, thread_id: str):
+        """
+        Yield reply tokens as the LLM produces them.
+        The sync graph streams on a worker thread and hands tokens to the event loop via a queue.
+        """
+        cfg = {"configurable": {"thread_id": thread_id}}
+        self.logger.info("Stream turn | thread=%s | text=%s", thread_id, text)
+        loop = asyncio.get_running_loop()
+        tokens: asyncio.Queue = asyncio.Queue()
+
+        def _produce():
+            try:
+                for token in self.agent.stream(text, config=cfg):
+                    loop.call_soon_threadsafe(tokens.put_nowait, token)
+            finally:
+                loop.call_soon_threadsafe(tokens.put_nowait, _STREAM_DONE)
+
+        producer = loop.run_in_executor(None, _produce)
+        while (token := await tokens.get()) is not _STREAM_DONE:
+            yield token
+        await producer  # re-raise anything the graph raised
+
+    @contextmanager
+    def _read_conn(self):
+        """Borrow a checkpointer bound to a pooled read connection."""
+        saver = self._readers.get()
+        try:
+            yield saver
+        finally:
+            self._readers.put(saver)
+
     def get_history(self, thread_id: str):
         cfg = {"configurable": {"thread_id": thread_id}}
-        snapshot = self.agent.graph.get_state(cfg)
-        return snapshot.state.get("messages", [])
+        if self._readers is None:
+            return self.agent.graph.get_state(cfg).values.get("messages", [])
+        with self._read_conn() as saver:
+            checkpoint = saver.get_tuple(cfg)
+        if checkpoint is None:
+            return []
+        return checkpoint.checkpoint["channel_values"].get("messages", [])
 
     def export_history(self, thread_id: str, out_dir="output") -> str:
         msgs = self.get_history(thread_id)
@@ -42,8 +129,8 @@ class ChatRuntime:
         ist = pytz.timezone("Asia/Kolkata")
         now = datetime.now(ist).strftime("%Y-%m-%d_%H-%M-%S")
         path = Path(out_dir) / f"{thread_id}_{now}.json"
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump([message_to_dict(m) for m in msgs], f, indent=2, ensure_ascii=False)
+        payload = [message_to_dict(m) for m in msgs]
+        path.write_bytes(orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
         self.logger.info("Exported history → %s", path)
         return str(path)
 
@@ -0,0 +1,63 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Union
+
+import orjson
+import pyarrow as pa
+from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore
+
+
+class ColumnarDocstore(Docstore):
+    """
+    Read-only docstore keyed by FAISS row id.
+
+    Chunks live in an Arrow table with a `text` column and a `meta` column
+    of orjson-encoded metadata. Loaded tables are memory-mapped, and a
+    `Document` is only built for the rows a search actually returns.
+    """
+
+    def __init__(self, table: pa.Table):
+        self._table = table
+        self._text = table.column("text")
+        self._meta = table.column("meta")
+
+    @classmethod
+    def from_documents(cls, docs: List[Document]) -> "ColumnarDocstore":
+        return cls(pa.table({
+            "text": [d.page_content for d in docs],
+            "meta": pa.array([orjson.dumps(d.metadata) for d in docs], type=pa.binary()),
+        }))
+
+    def __len__(self) -> int:
+        return self._table.num_rows
+
+    def texts(self) -> List[str]:
+        return self._text.to_pylist()
+
+    def search(self, search: int) -> Union[Document, str]:
+        if not 0 <= search < len(self):
+            return f"ID {search} not found."
+        return Document(
+            page_content=self._text[search].as_py(),
+            metadata=orjson.loads(self._meta[search].as_py())
+        )
+
+    def save(self, path: Path) -> None:
+        # Write beside the target and rename, so a crash never leaves a truncated file to mmap
+        path = Path(path)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, self._table.schema) as writer:
+                writer.write_table(self._table)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    @classmethod
+    def load(cls, path: Path) -> "ColumnarDocstore":
+        source = pa.memory_map(str(path), "r")
+        return cls(pa.ipc.open_file(source).read_all())
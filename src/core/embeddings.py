@@ -0,0 +1,95 @@
+import os, hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model with a content-addressed on-disk store.
+
+    Each document vector lives at `<cache_dir>/<sha256[:2]>/<sha256>.npy`, so
+    unchanged texts are never re-embedded, whatever the chunking or KB version.
+    Keep one `cache_dir` per model: the key is the text alone.
+
+    Query vectors are kept in a small in-memory LRU instead of on disk.
+    """
+
+    def __init__(self, inner: Embeddings, cache_dir: Path, query_cache_size: int = 1024):
+        self.inner = inner
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.query_cache_size = query_cache_size
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._queries_lock = threading.Lock()
+        self.logger = logging.getLogger("app.embeddings")
+
+    def _path(self, digest: str) -> Path:
+        return self.cache_dir / digest[:2] / f"{digest}.npy"
+
+    def _save(self, path: Path, vector: List[float]) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.asarray(vector, dtype=np.float32))
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def _lookup(self, texts: List[str]):
+        """Cached vectors (None for misses), their store paths, and the miss positions."""
+        paths = [self._path(hashlib.sha256(t.encode("utf-8")).hexdigest()) for t in texts]
+        vectors: List = [None] * len(texts)
+        misses = []
+        for i, path in enumerate(paths):
+            if path.exists():
+                vectors[i] = np.load(path, mmap_mode="r").tolist()
+            else:
+                misses.append(i)
+        return vectors, paths, misses
+
+    def _fill(self, vectors: List, paths: List[Path], misses: List[int], fresh: List[List[float]]) -> List[List[float]]:
+        for i, vector in zip(misses, fresh):
+            self._save(paths[i], vector)
+            vectors[i] = vector
+        self.logger.debug("embed_documents: %d cached, %d embedded", len(vectors) - len(misses), len(misses))
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, paths, misses = self._lookup(texts)
+        fresh = self.inner.embed_documents([texts[i] for i in misses]) if misses else []
+        return self._fill(vectors, paths, misses, fresh)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, paths, misses = self._lookup(texts)
+        fresh = await self.inner.aembed_documents([texts[i] for i in misses]) if misses else []
+        return self._fill(vectors, paths, misses, fresh)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Batch counterpart of `embed_query`: misses go out in one request, nothing persisted."""
+        with self._queries_lock:
+            vectors = [self._queries.get(t) for t in texts]
+            for t, v in zip(texts, vectors):
+                if v is not None:
+                    self._queries.move_to_end(t)
+        misses = [i for i, v in enumerate(vectors) if v is None]
+        if misses:
+            fresh = self.inner.embed_documents([texts[i] for i in misses])
+            with self._queries_lock:
+                for i, vector in zip(misses, fresh):
+                    vectors[i] = vector
+                    self._queries[texts[i]] = vector
+                while len(self._queries) > self.query_cache_size:
+                    self._queries.popitem(last=False)
+        return vectors
@@ -1,12 +1,31 @@
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+_listener: QueueListener | None = None
 
 def setup_logger():
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler("app.log", encoding="utf-8")
-        ]
-    )
+    """
+    Log to stderr and app.log. The calling thread still merges the message
+    args (and renders any traceback) when QueueHandler prepares the record;
+    a background listener thread does the final line formatting and the
+    stream and file writes.
+    """
+    global _listener
+    if _listener is None:
+        formatter = logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+        stream_handler = logging.StreamHandler()
+        file_handler = logging.FileHandler("app.log", encoding="utf-8", delay=True)
+        for handler in (stream_handler, file_handler):
+            handler.setFormatter(formatter)
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _listener = QueueListener(log_queue, stream_handler, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        root = logging.getLogger()
+        root.setLevel(logging.INFO)
+        root.addHandler(QueueHandler(log_queue))
     return logging.getLogger("app")
@@ -0,0 +1,103 @@
+import numpy as np
+import faiss
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+PQ_M = 64             # sub-quantizers; must divide the embedding dimension
+PQ_NBITS = 8          # 2**8 centroids per sub-quantizer -> 64 bytes per vector
+PQ_MAX_NLIST = 4096
+PQ_NPROBE = 16
+PQ_MIN_TRAIN = 1 << PQ_NBITS  # k-means needs at least one point per centroid
+
+
+def build_hnsw_index(vectors: np.ndarray, m: int = HNSW_M,
+                     ef_construction: int = HNSW_EF_CONSTRUCTION,
+                     ef_search: int = HNSW_EF_SEARCH) -> faiss.Index:
+    """Build an inner-product HNSW graph over an (N, d) float32 matrix, L2-normalized in place."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    index = faiss.IndexHNSWFlat(vectors.shape[1], m, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = ef_construction
+    index.add(vectors)
+    index.hnsw.efSearch = ef_search
+    return index
+
+
+def build_ivfpq_index(vectors: np.ndarray, m: int = PQ_M, nbits: int = PQ_NBITS,
+                     nprobe: int = PQ_NPROBE) -> faiss.Index:
+    """
+    Build an inner-product IVF-PQ index with an HNSW coarse quantizer over an (N, d)
+    float32 matrix, L2-normalized in place. Vectors are stored as `m` bytes of PQ
+    codes instead of `4 * d` bytes of floats.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    n, d = vectors.shape
+    if d % m:
+        raise ValueError(f"PQ sub-quantizers m={m} must divide embedding dimension d={d}")
+    if n < PQ_MIN_TRAIN:
+        raise ValueError(f"Need at least {PQ_MIN_TRAIN} vectors to train PQ, got {n}")
+
+    nlist = max(1, min(PQ_MAX_NLIST, n // 40))
+    # On unit vectors L2 and inner-product rankings agree, so the coarse quantizer stays L2
+    quantizer = faiss.IndexHNSWFlat(d, HNSW_M)
+    index = faiss.IndexIVFPQ(quantizer, d, nlist, m, nbits, faiss.METRIC_INNER_PRODUCT)
+    index.train(vectors)
+    index.add(vectors)
+    index.nprobe = nprobe
+    return index
+
+
+def build_sq8_index(vectors: np.ndarray) -> faiss.Index:
+    """
+    Build an exhaustive inner-product index over 8-bit scalar-quantized codes,
+    L2-normalized in place: `d` bytes per vector instead of `4 * d`.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    index = faiss.IndexScalarQuantizer(vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def read_index(path) -> faiss.Index:
+    """
+    Load a persisted index memory-mapped and read-only, so the OS pages vector
+    data in on demand instead of copying it all into RAM. Parts faiss cannot
+    map for a given index type are read normally.
+    """
+    return faiss.read_index(str(path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+
+
+def apply_search_params(index: faiss.Index, ef_search: int = HNSW_EF_SEARCH,
+                        nprobe: int = PQ_NPROBE) -> None:
+    """Re-apply query-time knobs, e.g. after `faiss.read_index`."""
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    if hasattr(index, "nprobe"):
+        index.nprobe = nprobe
+
+
+def to_gpu(index: faiss.Index) -> faiss.Index:
+    """
+    Copy a CPU IVF-PQ index onto every visible GPU (replicated when there are
+    several). Lookup tables are kept in float16: at m=64, nbits=8 the float32
+    tables need 64 KiB of shared memory, above the default per-block limit.
+    Raises ValueError for other index types (HNSW and QT_8bit SQ have no GPU
+    implementation) and RuntimeError if no GPU is available.
+    """
+    if not isinstance(index, faiss.IndexIVFPQ):
+        raise ValueError(f"GPU offload supports IVF-PQ indexes only, got {type(index).__name__}")
+    ngpu = faiss.get_num_gpus()
+    if ngpu == 0:
+        raise RuntimeError("No CUDA GPU visible to faiss")
+    if ngpu == 1:
+        options = faiss.GpuClonerOptions()
+        options.useFloat16 = True
+        return faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, index, options)
+    options = faiss.GpuMultipleClonerOptions()
+    options.useFloat16 = True
+    return faiss.index_cpu_to_all_gpus(index, co=options)
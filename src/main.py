@@ -1,11 +1,13 @@
+import asyncio
+
 from src.core.logger_config import setup_logger
 from src.core.agent import RAGAgent
 from src.core.chat_runtime import ChatRuntime
 
 if __name__ == "__main__":
     setup_logger()
-    agent = RAGAgent(knowledge_base="policies_db.json")  # compiled without persistence
-    chat = ChatRuntime(agent)  # recompile with SQLite persistence
+    agent = RAGAgent(knowledge_base="policies_db.json", build_graph_now=False)
+    chat = ChatRuntime(agent)  # compiles once, with SQLite persistence
 
     thread_id = "aayush-local-2"
     print("Type 'reset' to clear history, 'export' to save, 'quit' to exit.")
@@ -21,5 +23,5 @@ if __name__ == "__main__":
             path = chat.export_history(thread_id)
             print(f"(saved to {path})")
             continue
-        reply = chat.chat(user, thread_id)
+        reply = asyncio.run(chat.chat(user, thread_id))
         print("Bot:", reply)